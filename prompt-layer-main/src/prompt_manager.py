@@ -4,10 +4,12 @@
 prompt_manager.py
 - Loads YAML prompt templates from ../prompts/*.yaml
 - Provides:
-    - get_prompt(prompt_id, version=None) -> dict
-    - log_usage(...) -> dict (writes a line to ../prompt_usage.jsonl)
+    - get_prompt(prompt_id, version=None) -> read-only mapping
+    - log_usage(...) -> dict (queues a line for ../prompt_usage.jsonl)
+    - flush_usage() (block until queued usage lines are written and fsync'd)
+    - reopen_usage_log() (reopen the usage log after rotation; also on SIGHUP)
     - render_prompt(prompt_id, inputs, version=None) -> str
-- Also provides a tiny Flask API when run as __main__:
+- Also provides a tiny Flask API (blueprint `bp`, standalone `app`) when run as __main__:
     GET  /prompt/<prompt_id>?version=<version>
     POST /prompt/<prompt_id>/log  (body: JSON usage payload)
     POST /prompt/<prompt_id>/render (render a prompt with inputs)
@@ -16,92 +18,580 @@ prompt_manager.py
 """
 
 import os
-import glob
-import yaml
 import json
+import yaml
 import time
+import queue
+import atexit
+import threading
+import mmap
+import functools
+import signal
+import re
+from types import MappingProxyType
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Mapping
 from collections import defaultdict
-from statistics import mean
-
-from flask import Flask, jsonify, request, abort
 
-# Additional libs (install: jinja2 jsonschema packaging)
-from jinja2 import Template, StrictUndefined
-from jsonschema import validate as jsonschema_validate, ValidationError
-from packaging.version import parse as parse_version
+from flask import Blueprint, Flask, current_app, jsonify, request, abort
+from flask.json.provider import DefaultJSONProvider
+
+# Additional libs (install: jinja2 jsonschema packaging orjson)
+# Optional: inotify_simple (Linux) or watchdog enables prompt hot-reload;
+# gunicorn is used to serve the API when run as __main__
+import orjson
+from jinja2 import Environment, StrictUndefined
+from jsonschema import Draft202012Validator, SchemaError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+from packaging.version import InvalidVersion, parse as parse_version
+
+# libyaml's C loader is much faster than the pure-Python SafeLoader
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+    print("PyYAML has no libyaml support; using the slower pure-Python SafeLoader "
+          "(install libyaml and reinstall PyYAML to enable CSafeLoader)")
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # prompt-layer/
 PROMPTS_DIR = os.path.join(BASE_DIR, "prompts")
 USAGE_LOG_PATH = os.path.join(BASE_DIR, "prompt_usage.jsonl")
 
+
+# strict X.Y.Z only: anything with a suffix (pre-releases etc.) needs PEP 440 ordering;
+# ASCII digits only, since \d would also take Unicode digits that packaging rejects
+_VER_RE = re.compile(r"^([0-9]+)\.([0-9]+)\.([0-9]+)$")
+
+
+@functools.lru_cache(maxsize=4096)
+def _ver_key(s: str):
+    """
+    Memoized comparison key for a version string: a (major, minor, patch) int tuple
+    for plain X.Y.Z versions, else a packaging Version. Raises InvalidVersion.
+    """
+    m = _VER_RE.match(s)
+    if m:
+        return (int(m[1]), int(m[2]), int(m[3]))
+    return parse_version(s)
+
+
+def _as_version(key):
+    return parse_version("%d.%d.%d" % key) if type(key) is tuple else key
+
+
+def _ver_cmp(a, b) -> int:
+    """Compare two _ver_key results; tuple vs tuple avoids Version.__gt__."""
+    if type(a) is not tuple or type(b) is not tuple:
+        a, b = _as_version(a), _as_version(b)
+    return (a > b) - (a < b)
+
+
 # in-memory index: { prompt_id: [versions...] } where each entry is the parsed YAML dict
 _PROMPT_INDEX: Dict[str, List[Dict[str, Any]]] = {}
+# lookup tables built after sorting: read-only views so hits can be returned without copying
+_PROMPT_BY_VER: Dict[str, Dict[str, Mapping[str, Any]]] = {}
+_PROMPT_LATEST: Dict[str, Mapping[str, Any]] = {}
+# source path -> parsed entry, so a single changed file can be swapped in on reload
+_PROMPT_FILES: Dict[str, Dict[str, Any]] = {}
+# serializes writers (initial load, hot-reload); readers only see whole-dict swaps
+_PROMPTS_LOCK = threading.RLock()
 
+# shared Jinja2 environment; templates are compiled once in _load_prompts
+_JINJA_ENV = Environment(undefined=StrictUndefined, autoescape=False, auto_reload=False, cache_size=-1)
 
-def _load_prompts():
-    """Load all YAML prompts from PROMPTS_DIR into _PROMPT_INDEX (called at import)."""
-    global _PROMPT_INDEX
-    _PROMPT_INDEX = {}
-    pattern = os.path.join(PROMPTS_DIR, "*.yaml")
-    for path in glob.glob(pattern):
+# runtime-only entry keys that are not part of the prompt definition (never serialized)
+_RUNTIME_KEYS = frozenset({"_compiled_template", "_compile_error", "_validator", "_schema_error",
+                           "_json_bytes", "_public"})
+
+
+def _read_bytes(path: str) -> bytes:
+    """Read a whole file with raw os.open/os.read (no TextIOWrapper)."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        chunk_size = max(os.fstat(fd).st_size, 4096)
+        chunks = []
+        while True:
+            chunk = os.read(fd, chunk_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+    finally:
+        os.close(fd)
+
+
+def _is_prompt_file(name: str) -> bool:
+    return name.endswith(".yaml") and not name.startswith(".")
+
+
+def _load_prompt_file(path: str) -> Optional[Dict[str, Any]]:
+    """Parse one prompt YAML into an index entry; returns None if it is skipped or fails."""
+    try:
+        data = yaml.load(_read_bytes(path), Loader=_YamlLoader)
+        if not data or "prompt_id" not in data:
+            print(f"Skipping {path}: missing prompt_id")
+            return None
+        entry = dict(data)
+        entry["_source_file"] = os.path.basename(path)
+        # timezone-aware timestamp
+        entry["_loaded_at"] = datetime.now(timezone.utc).isoformat()
+        # ensure metadata fields exist
+        entry.setdefault("example_inputs", [])
+        entry.setdefault("expected_output_schema", {})
+        # compile template once; a template that doesn't compile (bad syntax, null/non-string
+        # template) keeps the prompt loadable and only its message is kept: render_prompt
+        # recompiles it so every caller gets its own exception, not one shared instance
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = yaml.safe_load(f)
-                if not data or "prompt_id" not in data:
-                    print(f"Skipping {path}: missing prompt_id")
-                    continue
-                pid = str(data["prompt_id"])
-                version = str(data.get("version", "0.0.0"))
-                entry = dict(data)
-                entry["_source_file"] = os.path.basename(path)
-                # timezone-aware timestamp
-                entry["_loaded_at"] = datetime.now(timezone.utc).isoformat()
-                # ensure metadata fields exist
-                entry.setdefault("example_inputs", [])
-                entry.setdefault("expected_output_schema", {})
-                _PROMPT_INDEX.setdefault(pid, []).append(entry)
-        except Exception as e:
-            print(f"Failed to load {path}: {e}")
+            entry["_compiled_template"] = _JINJA_ENV.from_string(entry.get("template", ""))
+        except Exception as te:
+            entry["_compile_error"] = str(te)
+        # build the output validator once (meta-schema check happens here, not per request)
+        schema = entry["expected_output_schema"]
+        if schema:
+            try:
+                cls = validator_for(schema, default=Draft202012Validator)
+                cls.check_schema(schema)
+                entry["_validator"] = cls(schema)
+            except Exception as se:
+                # keep the prompt servable; the error is reported per record as validation_error
+                message = se.message if isinstance(se, SchemaError) else str(se)
+                print(f"Invalid expected_output_schema in {path}: {message}")
+                entry["_schema_error"] = message
+        # what get_prompt hands out: the prompt definition without runtime objects
+        public = {k: v for k, v in entry.items() if k not in _RUNTIME_KEYS}
+        entry["_public"] = MappingProxyType(public)
+        # pre-serialize the GET /prompt response body exactly as jsonify does with Flask's
+        # default provider (non-debug): same encoder, settings and default hook (YAML turns
+        # unquoted dates into date objects), so floats, NaN and dates come out identical
+        try:
+            entry["_json_bytes"] = (json.dumps(public, default=DefaultJSONProvider.default, sort_keys=True,
+                                               separators=(",", ":")) + "\n").encode("utf-8")
+        except TypeError:
+            pass  # api_get_prompt falls back to jsonify
+        return entry
+    except Exception as e:
+        print(f"Failed to load {path}: {e}")
+        return None
+
+
+def _rebuild_index():
+    """
+    Rebuild _PROMPT_INDEX and the lookup tables from _PROMPT_FILES. New dicts are
+    built aside and then swapped in, so readers never take a lock.
+    Caller must hold _PROMPTS_LOCK.
+    """
+    global _PROMPT_INDEX, _PROMPT_BY_VER, _PROMPT_LATEST
+    index: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in _PROMPT_FILES.values():
+        index.setdefault(str(entry["prompt_id"]), []).append(entry)
 
     # sort version list by semantic version (newest first)
-    for pid, versions in _PROMPT_INDEX.items():
+    for pid, versions in index.items():
         try:
-            versions.sort(key=lambda x: parse_version(str(x.get("version", "0.0.0"))), reverse=True)
+            versions.sort(key=functools.cmp_to_key(
+                lambda x, y: _ver_cmp(_ver_key(str(x.get("version", "0.0.0"))),
+                                      _ver_key(str(y.get("version", "0.0.0"))))), reverse=True)
         except Exception:
             # fallback to lexical if parse fails for some reason
             versions.sort(key=lambda x: str(x.get("version", "")), reverse=True)
 
+    by_ver: Dict[str, Dict[str, Mapping[str, Any]]] = {}
+    latest: Dict[str, Mapping[str, Any]] = {}
+    for pid, versions in index.items():
+        table = by_ver.setdefault(pid, {})
+        for entry in versions:
+            # first (newest-sorted) entry wins if a version is duplicated
+            table.setdefault(str(entry.get("version")), MappingProxyType(entry))
+        latest[pid] = table[str(versions[0].get("version"))]
+    _PROMPT_INDEX = index
+    _PROMPT_BY_VER = by_ver
+    _PROMPT_LATEST = latest
+
+
+def _load_prompts():
+    """Load all YAML prompts from PROMPTS_DIR into _PROMPT_INDEX (called at import)."""
+    global _PROMPT_FILES
+    # scandir yields names and file types from a single directory read
+    try:
+        with os.scandir(PROMPTS_DIR) as it:
+            paths = [e.path for e in it if _is_prompt_file(e.name) and e.is_file()]
+    except FileNotFoundError:
+        print(f"Prompts directory not found: {PROMPTS_DIR}")
+        paths = []
+    files = {}
+    for path in paths:
+        entry = _load_prompt_file(path)
+        if entry is not None:
+            files[path] = entry
+    with _PROMPTS_LOCK:
+        _PROMPT_FILES = files
+        _rebuild_index()
+
+
+def _reload_prompt_file(path: str):
+    """
+    Re-parse a single changed (or removed) prompt file and swap it into the index.
+    Only a removed file drops its prompt: if the new contents don't load, the last
+    good version keeps being served.
+    """
+    if not os.path.isfile(path):
+        with _PROMPTS_LOCK:
+            if _PROMPT_FILES.pop(path, None) is None:
+                return
+            _rebuild_index()
+        print(f"Removed prompts from {os.path.basename(path)}")
+        return
+    entry = _load_prompt_file(path)
+    if entry is None:
+        # _load_prompt_file already printed why
+        if path in _PROMPT_FILES:
+            print(f"Reload of {os.path.basename(path)} failed; keeping the previously loaded version")
+        return
+    with _PROMPTS_LOCK:
+        _PROMPT_FILES[path] = entry
+        _rebuild_index()
+    print(f"Reloaded prompts from {os.path.basename(path)}")
+
 
 # load on import
 _load_prompts()
 
 
-def get_prompt(prompt_id: str, version: Optional[str] = None) -> Dict[str, Any]:
+# ---- Prompt hot-reload ----
+# Event-driven: a daemon thread waits on inotify (inotify_simple, Linux) or watchdog
+# and re-parses only the files that changed. Disable with PROMPT_MANAGER_WATCH=0.
+def _watch_prompts_inotify(ino):
+    while True:
+        # read_delay coalesces bursts (e.g. editor save = several events) into one batch
+        names = {ev.name for ev in ino.read(read_delay=50)}
+        for name in names:
+            if _is_prompt_file(name):
+                _reload_prompt_file(os.path.join(PROMPTS_DIR, name))
+
+
+def _start_prompt_watcher():
+    if os.environ.get("PROMPT_MANAGER_WATCH", "1") == "0" or not os.path.isdir(PROMPTS_DIR):
+        return
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        pass
+    else:
+        # add the watch before returning so no change after import can be missed
+        ino = INotify()
+        ino.add_watch(PROMPTS_DIR, flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE)
+        threading.Thread(target=_watch_prompts_inotify, args=(ino,), name="prompt-watcher", daemon=True).start()
+        return
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return
+
+    class _PromptEventHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            # ignore opened/closed_no_write events, which our own reads would trigger
+            if event.is_directory or event.event_type not in ("created", "modified", "closed", "moved", "deleted"):
+                return
+            for path in (event.src_path, getattr(event, "dest_path", "")):
+                if path and _is_prompt_file(os.path.basename(path)):
+                    _reload_prompt_file(path)
+
+    observer = Observer()
+    observer.daemon = True
+    observer.schedule(_PromptEventHandler(), PROMPTS_DIR, recursive=False)
+    observer.start()
+
+
+_start_prompt_watcher()
+
+
+def _get_prompt_ref(prompt_id: str, version: Optional[str] = None) -> Mapping[str, Any]:
     """
-    Fetch prompt metadata and template by prompt_id, optionally by version.
-    Returns a dict, or raises KeyError if not found.
+    Return the cached read-only prompt entry (no copy). Used by internal callers.
+    Raises KeyError if not found.
     """
-    if prompt_id not in _PROMPT_INDEX:
-        raise KeyError(f"prompt_id '{prompt_id}' not found")
-    candidates = _PROMPT_INDEX[prompt_id]
     if version is None:
-        # return highest-sorted version (first in list after semantic sort)
-        return dict(candidates[0])
-    # find exact version
-    for v in candidates:
-        if str(v.get("version")) == str(version):
-            return dict(v)
-    raise KeyError(f"prompt_id '{prompt_id}' with version '{version}' not found")
+        try:
+            return _PROMPT_LATEST[prompt_id]
+        except KeyError:
+            raise KeyError(f"prompt_id '{prompt_id}' not found") from None
+    try:
+        versions = _PROMPT_BY_VER[prompt_id]
+    except KeyError:
+        raise KeyError(f"prompt_id '{prompt_id}' not found") from None
+    try:
+        return versions[str(version)]
+    except KeyError:
+        raise KeyError(f"prompt_id '{prompt_id}' with version '{version}' not found") from None
+
+
+def get_prompt(prompt_id: str, version: Optional[str] = None) -> Mapping[str, Any]:
+    """
+    Fetch prompt metadata and template by prompt_id, optionally by version.
+    Returns a read-only mapping of the prompt definition (use dict(...) for a
+    mutable copy), or raises KeyError if not found.
+    """
+    return _get_prompt_ref(prompt_id, version)["_public"]
+
+
+# ---- Usage log writer ----
+# log_usage only serializes and enqueues; a single daemon thread coalesces queued
+# lines and appends each batch with one writev call (FIFO order kept). The log FD
+# stays open for the life of the process: O_APPEND makes every write land at the
+# current end of file, so other processes appending to the same log don't clobber it.
+_USAGE_BATCH_MAX = 128
+_USAGE_BATCH_WAIT_S = 0.005
+_USAGE_QUEUE: "queue.Queue[bytes]" = queue.Queue(maxsize=10000)  # put() blocks when full (backpressure)
+_USAGE_PUT_TIMEOUT_S = 5.0  # how long log_usage waits for room before raising
+_USAGE_WRITER: Optional[threading.Thread] = None
+_USAGE_WRITER_LOCK = threading.Lock()
+_USAGE_FD: Optional[int] = None
+_USAGE_FD_LOCK = threading.Lock()  # guards _USAGE_FD against a concurrent reopen
+_USAGE_REOPEN = threading.Event()  # set by reopen_usage_log(); honoured before the next batch
+# error of the writer's last failed write (None once a write succeeds); set under
+# _USAGE_QUEUE.all_tasks_done so flush_usage wakes up and raises instead of waiting
+_USAGE_WRITE_ERROR: Optional[OSError] = None
+
+
+def _open_usage_log() -> int:
+    """Open (creating if needed) the usage log for appending; only runs at import and on reopen."""
+    # create parent dir if needed
+    os.makedirs(os.path.dirname(USAGE_LOG_PATH), exist_ok=True)
+    flags = (os.O_WRONLY | os.O_APPEND | os.O_CREAT
+             | getattr(os, "O_CLOEXEC", 0) | getattr(os, "O_BINARY", 0))
+    return os.open(USAGE_LOG_PATH, flags, 0o644)
+
+
+def _write_all(fd: int, bufs: List[bytes]):
+    """
+    Write every buffer to fd, retrying on short writes. Written data is removed
+    from bufs as it goes, so after an OSError bufs holds exactly what is unwritten.
+    """
+    if not hasattr(os, "writev"):
+        # e.g. Windows: one joined write instead of a vectored one
+        bufs[:] = [b"".join(bufs)]
+    while bufs:
+        n = os.writev(fd, bufs) if len(bufs) > 1 else os.write(fd, bufs[0])
+        done = 0
+        while done < len(bufs) and n >= len(bufs[done]):
+            n -= len(bufs[done])
+            done += 1
+        del bufs[:done]
+        if n:
+            bufs[0] = bufs[0][n:]
+
+
+def _set_usage_write_error(error: Optional[OSError]):
+    global _USAGE_WRITE_ERROR
+    with _USAGE_QUEUE.all_tasks_done:
+        _USAGE_WRITE_ERROR = error
+        _USAGE_QUEUE.all_tasks_done.notify_all()
+
+
+def _usage_writer_loop():
+    global _USAGE_FD
+    while True:
+        batch = [_USAGE_QUEUE.get()]
+        deadline = time.monotonic() + _USAGE_BATCH_WAIT_S
+        while len(batch) < _USAGE_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(_USAGE_QUEUE.get(timeout=remaining))
+                else:
+                    batch.append(_USAGE_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        n_records = len(batch)
+        # records were already acknowledged (and counted in _METRICS), so never drop
+        # them: on failure reopen the log and retry the unwritten remainder with backoff
+        retry_delay = 0.1
+        while True:
+            try:
+                with _USAGE_FD_LOCK:
+                    if _USAGE_REOPEN.is_set() or _USAGE_FD is None:
+                        _USAGE_REOPEN.clear()
+                        # close first: the new FD may reuse the old number
+                        if _USAGE_FD is not None:
+                            try:
+                                os.close(_USAGE_FD)
+                            except OSError:
+                                pass
+                            _USAGE_FD = None
+                        _USAGE_FD = _open_usage_log()
+                    _write_all(_USAGE_FD, batch)
+                break
+            except OSError as e:
+                print(f"Failed to write {n_records} usage record(s), retrying in {retry_delay:.1f}s: {e}")
+                _set_usage_write_error(e)
+                _USAGE_REOPEN.set()
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 5.0)
+        if _USAGE_WRITE_ERROR is not None:
+            print("Usage log writes recovered")
+            _set_usage_write_error(None)
+        for _ in range(n_records):
+            _USAGE_QUEUE.task_done()
+
+
+def _ensure_usage_writer():
+    """Start the writer thread (once, on first log_usage)."""
+    global _USAGE_WRITER
+    if _USAGE_WRITER is not None:
+        return
+    with _USAGE_WRITER_LOCK:
+        if _USAGE_WRITER is None:
+            writer = threading.Thread(target=_usage_writer_loop, name="usage-log-writer", daemon=True)
+            writer.start()
+            _USAGE_WRITER = writer
+
+
+def reopen_usage_log():
+    """
+    Make the writer reopen prompt_usage.jsonl before its next batch (for log
+    rotation). Only sets a flag, so it is safe to call from a signal handler.
+    """
+    _USAGE_REOPEN.set()
+
+
+def _usage_log_error(message: str) -> OSError:
+    """A new OSError for log_usage/flush_usage that names the writer's last error, if any."""
+    if _USAGE_WRITE_ERROR is not None:
+        message = f"{message}; last write error: {_USAGE_WRITE_ERROR}"
+    return OSError(message)
+
+
+def flush_usage():
+    """
+    Block until every queued usage record has been written, then fsync the log.
+    Raises OSError instead of waiting while the writer is failing to write; the
+    queued records are kept and the writer keeps retrying them.
+    """
+    with _USAGE_QUEUE.all_tasks_done:
+        _USAGE_QUEUE.all_tasks_done.wait_for(
+            lambda: not _USAGE_QUEUE.unfinished_tasks or _USAGE_WRITE_ERROR is not None)
+        if _USAGE_QUEUE.unfinished_tasks:
+            pending = _USAGE_QUEUE.unfinished_tasks
+            raise _usage_log_error(f"{pending} usage record(s) not written yet") from _USAGE_WRITE_ERROR
+    with _USAGE_FD_LOCK:
+        if _USAGE_FD is not None:
+            os.fsync(_USAGE_FD)
+
+
+# open the log once at import; if that fails the writer retries on its first batch
+try:
+    _USAGE_FD = _open_usage_log()
+except OSError as e:
+    print(f"Failed to open usage log {USAGE_LOG_PATH}: {e}")
+
+
+def _flush_usage_at_exit():
+    # like flush_usage, but bounded so an unwritable log can't hang interpreter exit
+    with _USAGE_QUEUE.all_tasks_done:
+        _USAGE_QUEUE.all_tasks_done.wait_for(lambda: not _USAGE_QUEUE.unfinished_tasks, timeout=5.0)
+    with _USAGE_FD_LOCK:
+        if _USAGE_FD is not None:
+            os.fsync(_USAGE_FD)
+
 
+# don't lose queued records when the process exits (writer is a daemon thread)
+atexit.register(_flush_usage_at_exit)
 
-def _ensure_usage_file_exists():
+
+# ---- Usage metrics ----
+# rolling per-prompt aggregate updated by log_usage, so /metrics never rescans the log.
+# Only records logged through this process (plus the log contents at import) are counted.
+_METRICS: Dict[str, Dict[str, Any]] = {}
+_METRICS_LOCK = threading.Lock()
+
+
+def _new_metric() -> Dict[str, Any]:
+    # latest_version_key caches the parsed latest_version (None if it isn't a valid version)
+    return {"lat_sum": 0.0, "lat_n": 0, "count": 0, "last_seen": None,
+            "latest_version": None, "latest_version_key": None}
+
+
+def _update_metric(entry: Dict[str, Any], latency: Any, ts: Any, ver: Any):
+    """Fold one usage record into a metrics entry."""
+    if isinstance(latency, (int, float)):
+        entry["lat_sum"] += latency
+        entry["lat_n"] += 1
+    entry["count"] += 1
+
+    # update last_seen if timestamp is newer (string comparison OK for ISO8601)
+    if ts and (entry["last_seen"] is None or ts > entry["last_seen"]):
+        entry["last_seen"] = ts
+
+    # update latest_version using semantic comparison when possible; only the
+    # incoming version is parsed, the current latest keeps its parsed key
+    if ver:
+        try:
+            key = _ver_key(str(ver))
+        except InvalidVersion:
+            key = None
+        latest_key = entry["latest_version_key"]
+        if entry["latest_version"] is None:
+            newer = True
+        elif key is not None and latest_key is not None:
+            newer = _ver_cmp(key, latest_key) > 0
+        else:
+            # fallback to lexical compare if either side doesn't parse
+            newer = str(ver) > str(entry["latest_version"])
+        if newer:
+            entry["latest_version"] = ver
+            entry["latest_version_key"] = key
+
+
+def _metric_view(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Public shape of a metrics entry as returned by /metrics."""
+    return {
+        "count": entry["count"],
+        "avg_latency_ms": entry["lat_sum"] / entry["lat_n"] if entry["lat_n"] else None,
+        "last_seen": entry["last_seen"],
+        "latest_version": entry["latest_version"]
+    }
+
+
+def _scan_usage_metrics(path: str) -> Dict[str, Dict[str, Any]]:
+    """Aggregate metrics from a usage JSONL file in one pass."""
+    agg: Dict[str, Dict[str, Any]] = defaultdict(_new_metric)
+    with open(path, "rb") as f:
+        # empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}
+        # feed raw byte lines straight to orjson (no str decoding)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                try:
+                    rec = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # skip blank and malformed JSON lines
+                    continue
+                if not isinstance(rec, dict):
+                    continue
+                pid = rec.get("prompt_id") or "<unknown>"
+                _update_metric(agg[pid], rec.get("latency_ms"), rec.get("timestamp"), rec.get("version"))
+    return dict(agg)
+
+
+def _bootstrap_metrics():
+    """Seed _METRICS from the existing usage log (called at import)."""
+    global _METRICS
     if not os.path.exists(USAGE_LOG_PATH):
-        # create parent dir if needed
-        os.makedirs(os.path.dirname(USAGE_LOG_PATH), exist_ok=True)
-        with open(USAGE_LOG_PATH, "w", encoding="utf-8") as f:
-            pass
+        return
+    try:
+        metrics = _scan_usage_metrics(USAGE_LOG_PATH)
+    except Exception as e:
+        print(f"Failed to read usage file {USAGE_LOG_PATH}: {e}")
+        return
+    with _METRICS_LOCK:
+        _METRICS = metrics
+
+
+# seed metrics on import
+_bootstrap_metrics()
 
 
 def render_prompt(prompt_id: str, inputs: Dict[str, Any], version: Optional[str] = None) -> str:
@@ -110,11 +600,12 @@ def render_prompt(prompt_id: str, inputs: Dict[str, Any], version: Optional[str]
     Returns the rendered prompt string.
     Raises KeyError if prompt not found, or jinja2 exceptions for missing keys.
     """
-    prompt = get_prompt(prompt_id, version)
-    template_text = prompt.get("template", "")
-    tmpl = Template(template_text, undefined=StrictUndefined)
-    rendered = tmpl.render(**(inputs or {}))
-    return rendered
+    prompt = _get_prompt_ref(prompt_id, version)
+    template = prompt.get("_compiled_template")
+    if template is None:
+        # failed at load: compiling again raises a fresh exception of the original type
+        template = _JINJA_ENV.from_string(prompt.get("template", ""))
+    return template.render(**(inputs or {}))
 
 
 def log_usage(prompt_id: str,
@@ -124,26 +615,50 @@ def log_usage(prompt_id: str,
               latency_ms: float,
               metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    Append a usage record to prompt_usage.jsonl and return the record.
+    Queue a usage record for appending to prompt_usage.jsonl and return the record.
+    The line is written by a background thread; call flush_usage() when the
+    caller needs it on disk before continuing. Raises OSError if the queue stays
+    full for _USAGE_PUT_TIMEOUT_S (e.g. the log can't be written).
     Also validates `response` against expected_output_schema if available and
     records validation result in metadata.validation_error (if any).
     Fields written: timestamp, prompt_id, version, input, response, latency_ms, metadata
     """
-    _ensure_usage_file_exists()
-
-    validation_error = None
-    # try to fetch prompt metadata to get expected_output_schema
     try:
-        prompt_meta = get_prompt(prompt_id, version)
-        schema = prompt_meta.get("expected_output_schema")
-        if schema:
-            try:
-                jsonschema_validate(instance=response, schema=schema)
-            except ValidationError as ve:
-                validation_error = str(ve)
+        prompt_ref = _get_prompt_ref(prompt_id, version)
     except KeyError:
+        prompt_ref = None
+    return _log_usage_with_prompt(prompt_ref, prompt_id, version, input_data, response, latency_ms, metadata)
+
+
+def _log_usage_with_prompt(prompt_ref: Optional[Mapping[str, Any]],
+                           prompt_id: str,
+                           version: str,
+                           input_data: Dict[str, Any],
+                           response: Dict[str, Any],
+                           latency_ms: float,
+                           metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    log_usage body for callers that already resolved the prompt (prompt_ref is
+    the cached entry, or None if the prompt/version doesn't exist).
+    """
+    validation_error = None
+    if prompt_ref is None:
         # prompt not found — mark in validation_error for traceability
-        validation_error = (validation_error or "") + " prompt metadata not found."
+        validation_error = " prompt metadata not found."
+    elif "_validator" in prompt_ref:
+        error = best_match(prompt_ref["_validator"].iter_errors(response))
+        if error is not None:
+            validation_error = str(error)
+    elif "_schema_error" in prompt_ref:
+        validation_error = f"invalid expected_output_schema: {prompt_ref['_schema_error']}"
+
+    if validation_error:
+        # one new dict: the caller's metadata (e.g. the request body's) is never mutated,
+        # and there is nothing to copy when it is absent
+        if metadata:
+            metadata = {**metadata, "validation_error": validation_error}
+        else:
+            metadata = {"validation_error": validation_error}
 
     record = {
         "timestamp": datetime.now(timezone.utc).isoformat(),
@@ -155,21 +670,105 @@ def log_usage(prompt_id: str,
         "metadata": metadata or {}
     }
 
-    if validation_error:
-        record["metadata"] = dict(record["metadata"])
-        record["metadata"]["validation_error"] = validation_error
-
-    # append as JSON line
-    with open(USAGE_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    # serialize here so the writer thread only does I/O; orjson emits UTF-8 bytes
+    # with the trailing newline (NON_STR_KEYS matches json.dumps for int keys etc.)
+    try:
+        payload = orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # e.g. integers wider than 64 bits, which orjson rejects and json writes exactly;
+        # lone surrogates (valid in JSON input) can't be UTF-8, so they stay \uXXXX escapes
+        payload = json.dumps(record, ensure_ascii=False).encode("utf-8", "backslashreplace") + b"\n"
+    _ensure_usage_writer()
+    try:
+        _USAGE_QUEUE.put(payload, timeout=_USAGE_PUT_TIMEOUT_S)
+    except queue.Full:
+        full = f"usage log queue is full ({_USAGE_QUEUE.maxsize} records)"
+        raise _usage_log_error(full) from _USAGE_WRITE_ERROR
+
+    # keep the rolling /metrics aggregate in step with the log
+    pid_key = prompt_id or "<unknown>"
+    with _METRICS_LOCK:
+        entry = _METRICS.get(pid_key)
+        if entry is None:
+            entry = _METRICS[pid_key] = _new_metric()
+        _update_metric(entry, record["latency_ms"], record["timestamp"], version)
     return record
 
 
+# ---- Fork safety ----
+# Pre-fork servers (gunicorn) fork after import: threads don't survive the fork and a
+# lock held by one of them at that moment would stay locked forever in the child.
+def _reinit_after_fork():
+    global _PROMPTS_LOCK, _USAGE_QUEUE, _USAGE_WRITER, _USAGE_WRITER_LOCK
+    global _USAGE_FD_LOCK, _USAGE_REOPEN, _USAGE_WRITE_ERROR, _METRICS_LOCK
+    _PROMPTS_LOCK = threading.RLock()
+    _USAGE_QUEUE = queue.Queue(maxsize=_USAGE_QUEUE.maxsize)  # parent's pending lines stay with the parent
+    _USAGE_WRITER = None  # restarted lazily by the next log_usage
+    _USAGE_WRITER_LOCK = threading.Lock()
+    _USAGE_FD_LOCK = threading.Lock()
+    _USAGE_REOPEN = threading.Event()
+    _USAGE_REOPEN.set()  # take a fresh FD in case the log was rotated since the parent opened it
+    _USAGE_WRITE_ERROR = None
+    _METRICS_LOCK = threading.Lock()
+    _start_prompt_watcher()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
 # ---- Tiny HTTP API (Flask) ----
-app = Flask(__name__)
+# routes live on a blueprint so they can be mounted into another app; `app` below
+# is the standalone app used when run as __main__ (or via gunicorn)
+bp = Blueprint("prompts", __name__)
+
+
+# an integer literal longer than 19 digits may not fit in 64 bits
+_BIG_INT_RE = re.compile(rb"[0-9]{20,}")
+
+
+def _json_body() -> Dict[str, Any]:
+    """
+    Parse the raw request body (any content type, like get_json(force=True)).
+    orjson handles the common case; bodies it would read differently from the stdlib
+    parser that get_json uses go to json.loads instead: integers wider than 64 bits
+    (which orjson turns into floats) and anything orjson rejects (e.g. NaN/Infinity).
+    Aborts with 400 if the body is missing, not valid JSON, or not a JSON object.
+    """
+    raw = request.get_data(cache=False)
+    if not raw:
+        abort(400, description="Missing JSON body")
+    try:
+        if _BIG_INT_RE.search(raw):
+            body = json.loads(raw)
+        else:
+            try:
+                body = orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                body = json.loads(raw)
+    except ValueError:  # JSONDecodeError, UnicodeDecodeError
+        abort(400, description="Invalid JSON body")
+    if not body:
+        abort(400, description="Missing JSON body")
+    if not isinstance(body, dict):
+        abort(400, description="JSON body must be an object")
+    return body
+
+
+def _jsonify_matches_cache() -> bool:
+    """
+    True if jsonify in the current app would produce the cached _json_bytes: Flask's
+    own JSON provider with its default settings, outside debug mode (which indents).
+    Apps mounting bp with a custom provider or settings get jsonify instead.
+    """
+    provider = current_app.json
+    return (type(provider) is DefaultJSONProvider
+            and provider.default is DefaultJSONProvider.default
+            and provider.ensure_ascii and provider.sort_keys
+            and (provider.compact or (provider.compact is None and not current_app.debug)))
 
 
-@app.route("/health", methods=["GET"])
+@bp.route("/health", methods=["GET"])
 def api_health():
     """
     Basic health endpoint. Returns ok if the service can access prompts directory.
@@ -178,26 +777,26 @@ def api_health():
     return jsonify({"status": "ok" if ok else "error", "prompts_dir_exists": ok}), (200 if ok else 500)
 
 
-@app.route("/prompt/<prompt_id>", methods=["GET"])
+@bp.route("/prompt/<prompt_id>", methods=["GET"])
 def api_get_prompt(prompt_id):
     version = request.args.get("version")
     try:
-        prompt = get_prompt(prompt_id, version)
+        prompt = _get_prompt_ref(prompt_id, version)
     except KeyError:
         abort(404, description="Prompt not found")
-    return jsonify(prompt)
+    if "_json_bytes" in prompt and _jsonify_matches_cache():
+        return current_app.response_class(prompt["_json_bytes"], mimetype=current_app.json.mimetype)
+    return jsonify(dict(prompt["_public"]))
 
 
-@app.route("/prompt/<prompt_id>/render", methods=["POST"])
+@bp.route("/prompt/<prompt_id>/render", methods=["POST"])
 def api_render_prompt(prompt_id):
     """
     POST /prompt/<prompt_id>/render
     body: { "version": "1.0.0", "inputs": { ... } }
     returns: { "rendered": "..." }
     """
-    body = request.get_json(force=True, silent=True)
-    if not body:
-        abort(400, description="Missing JSON body")
+    body = _json_body()
     version = body.get("version")
     inputs = body.get("inputs", {})
     try:
@@ -209,11 +808,9 @@ def api_render_prompt(prompt_id):
     return jsonify({"rendered": rendered})
 
 
-@app.route("/prompt/<prompt_id>/log", methods=["POST"])
+@bp.route("/prompt/<prompt_id>/log", methods=["POST"])
 def api_log_usage(prompt_id):
-    body = request.get_json(force=True, silent=True)
-    if not body:
-        abort(400, description="Missing JSON body")
+    body = _json_body()
     version = body.get("version")
     input_data = body.get("input", {})
     response = body.get("response", {})
@@ -223,25 +820,31 @@ def api_log_usage(prompt_id):
     if version is None or latency_ms is None:
         abort(400, description="Missing required fields: version, latency_ms")
 
-    # optional: verify prompt exists (fail fast)
+    # verify prompt exists (fail fast); the resolved entry is reused for validation
     try:
-        _ = get_prompt(prompt_id, version)
+        prompt_ref = _get_prompt_ref(prompt_id, version)
     except KeyError:
         abort(404, description="Prompt or version not found")
 
-    rec = log_usage(prompt_id=prompt_id,
-                    version=version,
-                    input_data=input_data,
-                    response=response,
-                    latency_ms=latency_ms,
-                    metadata=metadata)
+    try:
+        rec = _log_usage_with_prompt(prompt_ref,
+                                     prompt_id=prompt_id,
+                                     version=version,
+                                     input_data=input_data,
+                                     response=response,
+                                     latency_ms=latency_ms,
+                                     metadata=metadata)
+    except OSError as e:
+        # the usage log is backed up (writer failing or far behind); the record was not accepted
+        abort(503, description=f"Usage log unavailable: {e}")
     return jsonify({"status": "ok", "record": rec})
 
 
-@app.route("/metrics", methods=["GET"])
+@bp.route("/metrics", methods=["GET"])
 def api_metrics():
     """
-    Return aggregated metrics from prompt_usage.jsonl:
+    Return aggregated usage metrics (kept in memory by log_usage, seeded from
+    prompt_usage.jsonl at import):
     {
       "<prompt_id>": {
          "count": int,
@@ -251,64 +854,61 @@ def api_metrics():
       }, ...
     }
     """
-    if not os.path.exists(USAGE_LOG_PATH):
-        return jsonify({"metrics": {}, "note": "no usage file found"}), 200
+    with _METRICS_LOCK:
+        metrics = {pid: _metric_view(entry) for pid, entry in _METRICS.items()}
+    return jsonify({"metrics": metrics}), 200
 
-    agg = defaultdict(lambda: {"latencies": [], "count": 0, "last_seen": None, "latest_version": None})
-    try:
-        with open(USAGE_LOG_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    rec = json.loads(line)
-                except Exception:
-                    # skip malformed JSON lines
-                    continue
 
-                pid = rec.get("prompt_id") or "<unknown>"
-                latency = rec.get("latency_ms")
-                ts = rec.get("timestamp")
-                ver = rec.get("version")
-
-                entry = agg[pid]
-                if isinstance(latency, (int, float)):
-                    entry["latencies"].append(float(latency))
-                entry["count"] += 1
-
-                # update last_seen if timestamp is newer (string comparison OK for ISO8601)
-                if ts and (entry["last_seen"] is None or ts > entry["last_seen"]):
-                    entry["last_seen"] = ts
-
-                # update latest_version using semantic comparison when possible
-                if ver:
-                    try:
-                        if entry["latest_version"] is None or parse_version(str(ver)) > parse_version(str(entry["latest_version"])):
-                            entry["latest_version"] = ver
-                    except Exception:
-                        # fallback to lexical compare if parse fails
-                        if entry["latest_version"] is None or str(ver) > str(entry["latest_version"]):
-                            entry["latest_version"] = ver
-    except Exception as e:
-        return jsonify({"error": f"failed to read usage file: {e}"}), 500
-
-    metrics = {}
-    for pid, data in agg.items():
-        avg_latency = mean(data["latencies"]) if data["latencies"] else None
-        metrics[pid] = {
-            "count": data["count"],
-            "avg_latency_ms": avg_latency,
-            "last_seen": data["last_seen"],
-            "latest_version": data["latest_version"]
-        }
+app = Flask(__name__)
+app.register_blueprint(bp)
 
-    return jsonify({"metrics": metrics}), 200
+
+def _serve_gunicorn(host: str, port: int):
+    """Serve app with gunicorn's gthread workers (PROMPT_MANAGER_WORKERS / _THREADS)."""
+    from gunicorn.app.base import BaseApplication
+
+    class _StandaloneApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    # default to one worker: usage metrics and the log writer are per process, so
+    # with several workers each one reports only the records it logged itself
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": int(os.environ.get("PROMPT_MANAGER_WORKERS", "1")),
+        "worker_class": "gthread",
+        "threads": int(os.environ.get("PROMPT_MANAGER_THREADS", str(4 * (os.cpu_count() or 1)))),
+    }
+    _StandaloneApplication(app, options).run()
 
 
 if __name__ == "__main__":
-    # development server - change host/port via PROMPT_MANAGER_PORT env var if needed
+    # change host/port via PROMPT_MANAGER_HOST / PROMPT_MANAGER_PORT env vars if needed;
+    # uses gunicorn when installed (POSIX only), otherwise Flask's development server
     port = int(os.environ.get("PROMPT_MANAGER_PORT", "5000"))
     host = os.environ.get("PROMPT_MANAGER_HOST", "127.0.0.1")
     print(f"Starting prompt manager API on http://{host}:{port}")
-    app.run(host=host, port=port, debug=True)
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+    if gunicorn is not None and os.environ.get("PROMPT_MANAGER_SERVER", "gunicorn") != "dev":
+        # gunicorn handles SIGHUP itself (worker restart); new workers reopen the log after fork
+        _serve_gunicorn(host, port)
+    else:
+        # logrotate-style reopen: move the file away, then send SIGHUP
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: reopen_usage_log())
+        # debug mode (debugger, no template caching) only when asked for explicitly;
+        # the stat-polling reloader stays off either way
+        debug_flag = os.environ.get("FLASK_DEBUG", "0") == "1"
+        app.run(host=host, port=port, debug=debug_flag, use_reloader=False)